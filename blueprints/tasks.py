@@ -1,26 +1,34 @@
-import json
+import logging
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from datetime import timezone
+from functools import wraps
 from typing import Any
 from typing import Dict
+from typing import List
+from typing import Optional
 
 import flask
+import orjson
 import requests
 from bs4 import BeautifulSoup
+from cachetools import LRUCache
+from cachetools import TTLCache
 from flask import current_app as app
 from little_boxes import activitypub as ap
 from little_boxes.activitypub import _to_list
 from little_boxes.errors import ActivityGoneError
 from little_boxes.errors import ActivityNotFoundError
 from little_boxes.errors import NotAnActivityError
+from pymongo import UpdateMany
+from pymongo import UpdateOne
 from requests.exceptions import HTTPError
 
 import config
 from config import DB
 from config import MEDIA_CACHE
 from core import gc
-from core.activitypub import SIG_AUTH
 from core.activitypub import Box
 from core.activitypub import _actor_hash
 from core.activitypub import _add_answers_to_question
@@ -30,8 +38,14 @@ from core.activitypub import new_context
 from core.activitypub import post_to_outbox
 from core.activitypub import save_reply
 from core.activitypub import update_cached_actor
+from core.db import bulk_write_activities
+from core.db import claim
 from core.db import find_one_activity
+from core.db import queue_update_activity
+from core.db import release
 from core.db import update_one_activity
+from core.delivery import broadcast
+from core.delivery import post
 from core.inbox import process_inbox
 from core.meta import MetaKey
 from core.meta import by_object_id
@@ -56,6 +70,15 @@ from utils.webmentions import discover_webmention_endpoint
 
 blueprint = flask.Blueprint("tasks", __name__)
 
+# Hash of the actors refreshed by `task_cache_actor` in the last hour
+_ACTOR_HASHES: TTLCache = TTLCache(maxsize=4096, ttl=3600)
+
+# (activity ID, object actor hash) already processed by `task_cache_object`
+_CACHED_OBJECTS: LRUCache = LRUCache(4096)
+
+# Used to download and resize the attachments of an activity concurrently
+_ATTACHMENTS_POOL = ThreadPoolExecutor(max_workers=8)
+
 
 class TaskError(Exception):
     """Raised to log the error for poussetaches."""
@@ -64,16 +87,66 @@ class TaskError(Exception):
         self.message = traceback.format_exc()
 
 
+def task_endpoint(f):
+    """This decorator parses the poussetaches task and passes it to the view."""
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        task = p.parse(flask.request)
+        app.logger.info("task=%r", task)
+        return f(task, *args, **kwargs)
+
+    return decorated_function
+
+
+def _inflight_key(task_name: str, iri: str) -> str:
+    return f"{task_name}:{iri}"
+
+
+def skip_inflight(task_name, iri_key=None):
+    """This decorator skips the task if the same one is being (or was just) processed.
+
+    Expects to be stacked under `task_endpoint`, the IRI is the payload (or `payload[iri_key]`).
+    """
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(task, *args, **kwargs):
+            iri = task.payload if iri_key is None else task.payload[iri_key]
+            key = _inflight_key(task_name, iri)
+            if not claim(key):
+                app.logger.info("%s already in-flight for %s", task_name, iri)
+                return ""
+
+            try:
+                return f(task, *args, **kwargs)
+            except Exception:
+                # Let the retry go through
+                release(key)
+                raise
+
+        return decorated_function
+
+    return decorator
+
+
 @blueprint.route("/task/update_question", methods=["POST"])
-def task_update_question() -> _Response:
+@task_endpoint
+def task_update_question(task: Any) -> _Response:
     """Sends an Update."""
-    task = p.parse(flask.request)
-    app.logger.info(f"task={task!r}")
     iri = task.payload
     try:
-        app.logger.info(f"Updating question {iri}")
+        app.logger.info("Updating question %s", iri)
         cc = [config.ID + "/followers"]
-        doc = DB.activities.find_one({"box": Box.OUTBOX.value, "remote_id": iri})
+        doc = DB.activities.find_one(
+            {"box": Box.OUTBOX.value, "remote_id": iri},
+            projection={
+                "remote_id": 1,
+                "activity.type": 1,
+                "activity.object": 1,
+                "meta.question_answers": 1,
+            },
+        )
         _add_answers_to_question(doc)
         question = ap.Question(**doc["activity"]["object"])
 
@@ -87,8 +160,6 @@ def task_update_question() -> _Response:
         raw_update["@context"] = config.DEFAULT_CTX
 
         update = ap.Update(**raw_update)
-        print(update)
-        print(update.to_dict())
         post_to_outbox(update)
 
     except HTTPError as err:
@@ -106,9 +177,8 @@ def task_update_question() -> _Response:
 
 
 @blueprint.route("/task/send_actor_update", methods=["POST"])
-def task_send_actor_update() -> _Response:
-    task = p.parse(flask.request)
-    app.logger.info(f"task={task!r}")
+@task_endpoint
+def task_send_actor_update(task: Any) -> _Response:
     try:
         update = ap.Update(
             actor=MY_PERSON.id,
@@ -121,20 +191,19 @@ def task_send_actor_update() -> _Response:
 
         post_to_outbox(update)
     except Exception as err:
-        app.logger.exception(f"failed to send actor update")
+        app.logger.exception("failed to send actor update")
         raise TaskError() from err
 
     return ""
 
 
 @blueprint.route("/task/fetch_og_meta", methods=["POST"])
-def task_fetch_og_meta() -> _Response:
-    task = p.parse(flask.request)
-    app.logger.info(f"task={task!r}")
+@task_endpoint
+def task_fetch_og_meta(task: Any) -> _Response:
     iri = task.payload
     try:
         activity = ap.fetch_remote_activity(iri)
-        app.logger.info(f"activity={activity!r}")
+        app.logger.info("activity=%r", activity)
         if activity.has_type(ap.ActivityType.CREATE):
             note = activity.get_object()
             links = opengraph.links_from_note(note.to_dict())
@@ -144,14 +213,15 @@ def task_fetch_og_meta() -> _Response:
                     continue
                 config.MEDIA_CACHE.cache_og_image(og["image"], iri)
 
-            app.logger.debug(f"OG metadata {og_metadata!r}")
-            DB.activities.update_one(
-                {"remote_id": iri}, {"$set": {"meta.og_metadata": og_metadata}}
+            app.logger.debug("OG metadata %r", og_metadata)
+            # Not written yet, a failed flush is requeued and retried by the worker (not by the task)
+            queue_update_activity(
+                by_remote_id(iri), {"$set": {"meta.og_metadata": og_metadata}}
             )
 
-        app.logger.info(f"OG metadata fetched for {iri}: {og_metadata}")
+        app.logger.info("OG metadata fetched for %s: %s", iri, og_metadata)
     except (ActivityGoneError, ActivityNotFoundError):
-        app.logger.exception(f"dropping activity {iri}, skip OG metedata")
+        app.logger.exception("dropping activity %s, skip OG metedata", iri)
         return ""
     except requests.exceptions.HTTPError as http_err:
         if 400 <= http_err.response.status_code < 500:
@@ -160,31 +230,38 @@ def task_fetch_og_meta() -> _Response:
         app.logger.exception("failed to fetch OG metadata")
         raise TaskError() from http_err
     except Exception as err:
-        app.logger.exception(f"failed to fetch OG metadata for {iri}")
+        app.logger.exception("failed to fetch OG metadata for %s", iri)
         raise TaskError() from err
 
     return ""
 
 
 @blueprint.route("/task/cache_object", methods=["POST"])
-def task_cache_object() -> _Response:
-    task = p.parse(flask.request)
-    app.logger.info(f"task={task!r}")
+@task_endpoint
+@skip_inflight("cache_object")
+def task_cache_object(task: Any) -> _Response:
     iri = task.payload
     try:
         activity = ap.fetch_remote_activity(iri)
-        app.logger.info(f"activity={activity!r}")
+        app.logger.info("activity=%r", activity)
         obj = activity.get_object()
-        Tasks.cache_emojis(obj)
 
         # Refetch the object actor (without cache)
         obj_actor = ap.fetch_remote_activity(obj.get_actor().id, no_cache=True)
+        obj_actor_hash = _actor_hash(obj_actor)
+
+        # Skip duplicates (retries, forwards...) if nothing changed since
+        cache_key = (activity.id, obj_actor_hash)
+        if cache_key in _CACHED_OBJECTS:
+            app.logger.info("object already cached for %s", iri)
+            return ""
+
+        Tasks.cache_emojis(obj)
 
         cache = {MetaKey.OBJECT: obj.to_dict(embed=True)}
 
         if activity.get_actor().id != obj_actor.id:
             # Cache the object actor
-            obj_actor_hash = _actor_hash(obj_actor)
             cache[MetaKey.OBJECT_ACTOR] = obj_actor.to_dict(embed=True)
             cache[MetaKey.OBJECT_ACTOR_ID] = obj_actor.id
             cache[MetaKey.OBJECT_ACTOR_HASH] = obj_actor_hash
@@ -193,61 +270,59 @@ def task_cache_object() -> _Response:
             update_cached_actor(obj_actor)
 
         update_one_activity(by_remote_id(activity.id), upsert(cache))
+        _CACHED_OBJECTS[cache_key] = True
 
     except (ActivityGoneError, ActivityNotFoundError, NotAnActivityError):
-        DB.activities.update_one({"remote_id": iri}, {"$set": {"meta.deleted": True}})
-        app.logger.exception(f"flagging activity {iri} as deleted, no object caching")
+        queue_update_activity(by_remote_id(iri), upsert({MetaKey.DELETED: True}))
+        app.logger.exception("flagging activity %s as deleted, no object caching", iri)
     except Exception as err:
-        app.logger.exception(f"failed to cache object for {iri}")
+        app.logger.exception("failed to cache object for %s", iri)
         raise TaskError() from err
 
     return ""
 
 
 @blueprint.route("/task/finish_post_to_outbox", methods=["POST"])  # noqa:C901
-def task_finish_post_to_outbox() -> _Response:
-    task = p.parse(flask.request)
-    app.logger.info(f"task={task!r}")
+@task_endpoint
+def task_finish_post_to_outbox(task: Any) -> _Response:
     iri = task.payload
     try:
         activity = ap.fetch_remote_activity(iri)
-        app.logger.info(f"activity={activity!r}")
+        app.logger.info("activity=%r", activity)
 
         recipients = activity.recipients()
 
         process_outbox(activity, {})
 
-        app.logger.info(f"recipients={recipients}")
+        app.logger.info("recipients=%s", recipients)
         activity = ap.clean_activity(activity.to_dict())
 
-        payload = json.dumps(activity)
-        for recp in recipients:
-            app.logger.debug(f"posting to {recp}")
-            Tasks.post_to_remote_inbox(payload, recp)
+        # The payload goes through poussetaches as JSON, so it must be a string
+        payload = orjson.dumps(activity).decode("utf-8")
+        Tasks.broadcast(payload, recipients)
     except (ActivityGoneError, ActivityNotFoundError):
-        app.logger.exception(f"no retry")
+        app.logger.exception("no retry")
     except Exception as err:
-        app.logger.exception(f"failed to post to remote inbox for {iri}")
+        app.logger.exception("failed to post to remote inbox for %s", iri)
         raise TaskError() from err
 
     return ""
 
 
 @blueprint.route("/task/finish_post_to_inbox", methods=["POST"])  # noqa: C901
-def task_finish_post_to_inbox() -> _Response:
-    task = p.parse(flask.request)
-    app.logger.info(f"task={task!r}")
+@task_endpoint
+def task_finish_post_to_inbox(task: Any) -> _Response:
     iri = task.payload
     try:
         activity = ap.fetch_remote_activity(iri)
-        app.logger.info(f"activity={activity!r}")
+        app.logger.info("activity=%r", activity)
 
         process_inbox(activity, {})
 
     except (ActivityGoneError, ActivityNotFoundError, NotAnActivityError):
-        app.logger.exception(f"no retry")
+        app.logger.exception("no retry")
     except Exception as err:
-        app.logger.exception(f"failed to cfinish post to inbox for {iri}")
+        app.logger.exception("failed to cfinish post to inbox for %s", iri)
         raise TaskError() from err
 
     return ""
@@ -261,7 +336,7 @@ def select_video_to_cache(links):
             videos.append({"href": link["href"], "height": link["height"]})
 
     if not videos:
-        app.logger.warning(f"failed to select a video from {links!r}")
+        app.logger.warning("failed to select a video from %r", links)
         return None
 
     videos = sorted(videos, key=lambda l: l["height"])
@@ -272,16 +347,25 @@ def select_video_to_cache(links):
     return videos[0]
 
 
+def _try_cache_attachment(attachment: Dict[str, Any], iri: str) -> Optional[Exception]:
+    """Runs outside of the app context (in `_ATTACHMENTS_POOL`), so errors are returned instead of logged."""
+    try:
+        config.MEDIA_CACHE.cache_attachment(attachment, iri)
+    except Exception as exc:
+        return exc
+
+    return None
+
+
 @blueprint.route(
     "/task/cache_attachments", methods=["POST"]
 )  # noqa: C910  # too complex
-def task_cache_attachments() -> _Response:
-    task = p.parse(flask.request)
-    app.logger.info(f"task={task!r}")
+@task_endpoint
+def task_cache_attachments(task: Any) -> _Response:
     iri = task.payload
     try:
         activity = ap.fetch_remote_activity(iri)
-        app.logger.info(f"caching attachment for activity={activity!r}")
+        app.logger.info("caching attachment for activity=%r", activity)
         # Generates thumbnails for the actor's icon and the attachments if any
 
         if activity.has_type([ap.ActivityType.CREATE, ap.ActivityType.ANNOUNCE]):
@@ -305,51 +389,62 @@ def task_cache_attachments() -> _Response:
             elif isinstance(obj.url, str):
                 Tasks.cache_attachment({"url": obj.url}, iri)
             else:
-                app.logger.warning(f"failed to parse video link {obj!r} for {iri}")
-
-        # Iter the attachments
-        for attachment in obj._data.get("attachment", []):
-            Tasks.cache_attachment(attachment, iri)
+                app.logger.warning("failed to parse video link %r for %s", obj, iri)
+
+        # Cache the attachments concurrently, the failed ones are retried in a dedicated task
+        attachments = obj._data.get("attachment", [])
+        for attachment, err in zip(
+            attachments,
+            _ATTACHMENTS_POOL.map(
+                lambda attachment: _try_cache_attachment(attachment, iri), attachments
+            ),
+        ):
+            if err:
+                app.logger.error(
+                    "failed to cache attachment %r for %s",
+                    attachment,
+                    iri,
+                    exc_info=err,
+                )
+                Tasks.cache_attachment(attachment, iri)
 
-        app.logger.info(f"attachments cached for {iri}")
+        app.logger.info("attachments cached for %s", iri)
 
     except (ActivityGoneError, ActivityNotFoundError, NotAnActivityError):
-        app.logger.exception(f"dropping activity {iri}, no attachment caching")
+        app.logger.exception("dropping activity %s, no attachment caching", iri)
     except Exception as err:
-        app.logger.exception(f"failed to cache attachments for {iri}")
+        app.logger.exception("failed to cache attachments for %s", iri)
         raise TaskError() from err
 
     return ""
 
 
 @blueprint.route("/task/cache_attachment", methods=["POST"])
-def task_cache_attachment() -> _Response:
-    task = p.parse(flask.request)
-    app.logger.info(f"task={task!r}")
+@task_endpoint
+def task_cache_attachment(task: Any) -> _Response:
     iri = task.payload["iri"]
     attachment = task.payload["attachment"]
     try:
-        app.logger.info(f"caching attachment {attachment!r} for {iri}")
+        app.logger.info("caching attachment %r for %s", attachment, iri)
 
         config.MEDIA_CACHE.cache_attachment(attachment, iri)
 
-        app.logger.info(f"attachment {attachment!r} cached for {iri}")
+        app.logger.info("attachment %r cached for %s", attachment, iri)
     except Exception as err:
-        app.logger.exception(f"failed to cache attachment {attachment!r} for {iri}")
+        app.logger.exception("failed to cache attachment %r for %s", attachment, iri)
         raise TaskError() from err
 
     return ""
 
 
 @blueprint.route("/task/send_webmention", methods=["POST"])
-def task_send_webmention() -> _Response:
-    task = p.parse(flask.request)
-    app.logger.info(f"task={task!r}")
+@task_endpoint
+def task_send_webmention(task: Any) -> _Response:
     note_url = task.payload["note_url"]
     link = task.payload["link"]
     remote_id = task.payload["remote_id"]
     try:
-        app.logger.info(f"trying to send webmention source={note_url} target={link}")
+        app.logger.info("trying to send webmention source=%s target=%s", note_url, link)
         webmention_endpoint = discover_webmention_endpoint(link)
         if not webmention_endpoint:
             app.logger.info("no webmention endpoint")
@@ -360,7 +455,7 @@ def task_send_webmention() -> _Response:
             data={"source": note_url, "target": link},
             headers={"User-Agent": config.USER_AGENT},
         )
-        app.logger.info(f"webmention endpoint resp={resp}/{resp.text}")
+        app.logger.info("webmention endpoint resp=%s/%s", resp, resp.text)
         resp.raise_for_status()
     except HTTPError as err:
         app.logger.exception("request failed")
@@ -370,23 +465,33 @@ def task_send_webmention() -> _Response:
 
         raise TaskError() from err
     except Exception as err:
-        app.logger.exception(f"failed to cache actor for {link}/{remote_id}/{note_url}")
+        app.logger.exception(
+            "failed to cache actor for %s/%s/%s", link, remote_id, note_url
+        )
         raise TaskError() from err
 
     return ""
 
 
 @blueprint.route("/task/cache_actor", methods=["POST"])  # noqa: C910  # too complex
-def task_cache_actor() -> _Response:
-    task = p.parse(flask.request)
-    app.logger.info(f"task={task!r}")
+@task_endpoint
+@skip_inflight("cache_actor", iri_key="iri")
+def task_cache_actor(task: Any) -> _Response:
     iri = task.payload["iri"]
     try:
         activity = ap.fetch_remote_activity(iri)
-        app.logger.info(f"activity={activity!r}")
+        app.logger.info("activity=%r", activity)
 
-        # Reload the actor without caching (in case it got upated)
-        actor = ap.fetch_remote_activity(activity.get_actor().id, no_cache=True)
+        cached_actor = activity.get_actor()
+        # Skip the remote refetch if this actor was refreshed recently and did not change since
+        actor_up_to_date = _ACTOR_HASHES.get(cached_actor.id) == _actor_hash(
+            cached_actor
+        )
+        if actor_up_to_date:
+            actor = cached_actor
+        else:
+            # Reload the actor without caching (in case it got upated)
+            actor = ap.fetch_remote_activity(cached_actor.id, no_cache=True)
 
         # Fetch the Open Grah metadata if it's a `Create`
         if activity.has_type(ap.ActivityType.CREATE):
@@ -405,18 +510,26 @@ def task_cache_actor() -> _Response:
             except Exception:
                 app.logger.exception("failed to cache links")
 
+        ops = []
         if activity.has_type(ap.ActivityType.FOLLOW):
             if actor.id == config.ID:
                 # It's a new following, cache the "object" (which is the actor we follow)
-                DB.activities.update_one(
-                    by_remote_id(iri),
-                    upsert({MetaKey.OBJECT: activity.get_object().to_dict(embed=True)}),
+                ops.append(
+                    UpdateOne(
+                        by_remote_id(iri),
+                        upsert(
+                            {MetaKey.OBJECT: activity.get_object().to_dict(embed=True)}
+                        ),
+                    )
                 )
 
-        # Cache the actor info
-        update_cached_actor(actor)
+        # Cache the actor info (the Follow update is sent in the same `bulk_write`), this
+        # is needed even if the actor is up to date as it sets the actor of new activities
+        update_cached_actor(actor, extra_ops=ops)
+        if not actor_up_to_date:
+            _ACTOR_HASHES[actor.id] = _actor_hash(actor)
 
-        app.logger.info(f"actor cached for {iri}")
+        app.logger.info("actor cached for %s", iri)
         if not activity.has_type([ap.ActivityType.CREATE, ap.ActivityType.ANNOUNCE]):
             return ""
 
@@ -426,92 +539,103 @@ def task_cache_actor() -> _Response:
             Tasks.cache_attachments(iri)
 
     except (ActivityGoneError, ActivityNotFoundError):
-        DB.activities.update_one({"remote_id": iri}, {"$set": {"meta.deleted": True}})
-        app.logger.exception(f"flagging activity {iri} as deleted, no actor caching")
+        queue_update_activity(by_remote_id(iri), upsert({MetaKey.DELETED: True}))
+        app.logger.exception("flagging activity %s as deleted, no actor caching", iri)
     except Exception as err:
-        app.logger.exception(f"failed to cache actor for {iri}")
+        app.logger.exception("failed to cache actor for %s", iri)
         raise TaskError() from err
 
     return ""
 
 
 @blueprint.route("/task/cache_actor_icon", methods=["POST"])
-def task_cache_actor_icon() -> _Response:
-    task = p.parse(flask.request)
-    app.logger.info(f"task={task!r}")
+@task_endpoint
+def task_cache_actor_icon(task: Any) -> _Response:
     actor_iri = task.payload["actor_iri"]
     icon_url = task.payload["icon_url"]
     try:
         MEDIA_CACHE.cache_actor_icon(icon_url)
     except Exception as exc:
-        err = f"failed to cache actor icon {icon_url} for {actor_iri}"
-        app.logger.exception(err)
+        app.logger.exception(
+            "failed to cache actor icon %s for %s", icon_url, actor_iri
+        )
         raise TaskError() from exc
 
     return ""
 
 
 @blueprint.route("/task/cache_emoji", methods=["POST"])
-def task_cache_emoji() -> _Response:
-    task = p.parse(flask.request)
-    app.logger.info(f"task={task!r}")
+@task_endpoint
+def task_cache_emoji(task: Any) -> _Response:
     iri = task.payload["iri"]
     url = task.payload["url"]
     try:
         MEDIA_CACHE.cache_emoji(url, iri)
     except Exception as exc:
-        err = f"failed to cache emoji {url} at {iri}"
-        app.logger.exception(err)
+        app.logger.exception("failed to cache emoji %s at %s", url, iri)
         raise TaskError() from exc
 
     return ""
 
 
 @blueprint.route("/task/forward_activity", methods=["POST"])
-def task_forward_activity() -> _Response:
-    task = p.parse(flask.request)
-    app.logger.info(f"task={task!r}")
+@task_endpoint
+def task_forward_activity(task: Any) -> _Response:
     iri = task.payload
     try:
         activity = ap.fetch_remote_activity(iri)
         recipients = back.followers_as_recipients()
-        app.logger.debug(f"Forwarding {activity!r} to {recipients}")
+        app.logger.debug("Forwarding %r to %s", activity, recipients)
         activity = ap.clean_activity(activity.to_dict())
-        payload = json.dumps(activity)
-        for recp in recipients:
-            app.logger.debug(f"forwarding {activity!r} to {recp}")
-            Tasks.post_to_remote_inbox(payload, recp)
+        # The payload goes through poussetaches as JSON, so it must be a string
+        payload = orjson.dumps(activity).decode("utf-8")
+        # `followers_as_recipients` already returns deduplicated shared inboxes
+        Tasks.broadcast(payload, recipients)
+    except Exception as err:
+        app.logger.exception("task failed")
+        raise TaskError() from err
+
+    return ""
+
+
+@blueprint.route("/task/broadcast", methods=["POST"])
+@task_endpoint
+def task_broadcast(task: Any) -> _Response:
+    """Post an activity to all the remote inboxes concurrently."""
+    payload, recipients = task.payload["payload"], task.payload["recipients"]
+    try:
+        to_retry = broadcast(payload, recipients)
     except Exception as err:
         app.logger.exception("task failed")
         raise TaskError() from err
 
+    # The deliveries were made, raising now would re-run the whole broadcast
+    for recp in to_retry:
+        # Server errors are retried individually
+        app.logger.info("scheduling a retry for %s", recp)
+        try:
+            Tasks.post_to_remote_inbox(payload, recp)
+        except Exception:
+            app.logger.exception("failed to schedule a retry for %s", recp)
+
     return ""
 
 
 @blueprint.route("/task/post_to_remote_inbox", methods=["POST"])
-def task_post_to_remote_inbox() -> _Response:
+@task_endpoint
+def task_post_to_remote_inbox(task: Any) -> _Response:
     """Post an activity to a remote inbox."""
-    task = p.parse(flask.request)
-    app.logger.info(f"task={task!r}")
     payload, to = task.payload["payload"], task.payload["to"]
     try:
         app.logger.info("payload=%s", payload)
-        app.logger.info("generating sig")
-        signed_payload = json.loads(payload)
-
         app.logger.info("to=%s", to)
-        resp = requests.post(
-            to,
-            data=json.dumps(signed_payload),
-            auth=SIG_AUTH,
-            headers={
-                "Content-Type": config.HEADERS[1],
-                "Accept": config.HEADERS[1],
-                "User-Agent": config.USER_AGENT,
-            },
-        )
-        app.logger.info("resp=%s", resp)
-        app.logger.info("resp_body=%s", resp.text)
+        resp = post(payload, to)
+        app.logger.info("resp=%s", resp.status_code)
+        if app.logger.isEnabledFor(logging.DEBUG):
+            # Only decode the beginning of the body, it's often the echoed activity
+            app.logger.debug(
+                "resp_body=%s", resp.content[:512].decode("utf-8", "replace")
+            )
         resp.raise_for_status()
     except HTTPError as err:
         track_failed_send(to)
@@ -537,19 +661,19 @@ def task_post_to_remote_inbox() -> _Response:
 
 
 @blueprint.route("/task/fetch_remote_question", methods=["POST"])
-def task_fetch_remote_question() -> _Response:
+@task_endpoint
+def task_fetch_remote_question(task: Any) -> _Response:
     """Fetch a remote question for implementation that does not send Update."""
-    task = p.parse(flask.request)
-    app.logger.info(f"task={task!r}")
     iri = task.payload
     try:
-        app.logger.info(f"Fetching remote question {iri}")
+        app.logger.info("Fetching remote question %s", iri)
         local_question = DB.activities.find_one(
             {
                 "box": Box.INBOX.value,
                 "type": ap.ActivityType.CREATE.value,
                 "activity.object.id": iri,
-            }
+            },
+            projection={"remote_id": 1, "meta.voted_for": 1, "meta.subscribed": 1},
         )
         try:
             remote_question = ap.get_backend().fetch_iri(iri, no_cache=True)
@@ -574,18 +698,24 @@ def task_fetch_remote_question() -> _Response:
                 }
             )
 
+        ops: List[Any] = []
         # Update the Create if we received it in the inbox
         if local_question:
-            DB.activities.update_one(
-                {"remote_id": local_question["remote_id"], "box": Box.INBOX.value},
-                {"$set": {"activity.object": remote_question}},
+            ops.append(
+                UpdateOne(
+                    {"remote_id": local_question["remote_id"], "box": Box.INBOX.value},
+                    {"$set": {"activity.object": remote_question}},
+                )
             )
 
         # Also update all the cached copies (Like, Announce...)
-        DB.activities.update_many(
-            {"meta.object.id": remote_question["id"]},
-            {"$set": {"meta.object": remote_question}},
+        ops.append(
+            UpdateMany(
+                {"meta.object.id": remote_question["id"]},
+                {"$set": {"meta.object": remote_question}},
+            )
         )
+        bulk_write_activities(ops)
 
     except HTTPError as err:
         app.logger.exception("request failed")
@@ -602,9 +732,8 @@ def task_fetch_remote_question() -> _Response:
 
 
 @blueprint.route("/task/cleanup", methods=["POST"])
-def task_cleanup() -> _Response:
-    task = p.parse(flask.request)
-    app.logger.info(f"task={task!r}")
+@task_endpoint
+def task_cleanup(task: Any) -> _Response:
     gc.perform()
     return ""
 
@@ -622,14 +751,13 @@ def _is_local_reply(activity: ap.BaseActivity) -> bool:
 
 
 @blueprint.route("/task/process_reply", methods=["POST"])
-def task_process_reply() -> _Response:
+@task_endpoint
+def task_process_reply(task: Any) -> _Response:
     """Process `Announce`d posts from Pleroma relays in order to process replies of activities that are in the inbox."""
-    task = p.parse(flask.request)
-    app.logger.info(f"task={task!r}")
     iri = task.payload
     try:
         activity = ap.fetch_remote_activity(iri)
-        app.logger.info(f"checking for reply activity={activity!r}")
+        app.logger.info("checking for reply activity=%r", activity)
 
         # Some AP server always return Create when requesting an object
         if activity.has_type(ap.ActivityType.CREATE):
@@ -638,7 +766,7 @@ def task_process_reply() -> _Response:
         in_reply_to = activity.get_in_reply_to()
         if not in_reply_to:
             # If it's not reply, we can drop it
-            app.logger.info(f"activity={activity!r} is not a reply, dropping it")
+            app.logger.info("activity=%r is not a reply, dropping it", activity)
             return ""
 
         root_reply = in_reply_to
@@ -663,7 +791,7 @@ def task_process_reply() -> _Response:
 
             new_replies.append(reply)
 
-        app.logger.info(f"root_reply={reply!r} for activity={activity!r}")
+        app.logger.info("root_reply=%r for activity=%r", reply, activity)
 
         # In case the activity was from the inbox
         update_one_activity(
@@ -723,38 +851,38 @@ def task_process_reply() -> _Response:
             # And cache the attachments
             Tasks.cache_attachments(new_reply.id)
     except (ActivityGoneError, ActivityNotFoundError):
-        app.logger.exception(f"dropping activity {iri}, skip processing")
+        app.logger.exception("dropping activity %s, skip processing", iri)
         return ""
     except Exception as err:
-        app.logger.exception(f"failed to process new activity {iri}")
+        app.logger.exception("failed to process new activity %s", iri)
         raise TaskError() from err
 
     return ""
 
 
 @blueprint.route("/task/process_new_activity", methods=["POST"])  # noqa:c901
-def task_process_new_activity() -> _Response:
+@task_endpoint
+@skip_inflight("process_new_activity")
+def task_process_new_activity(task: Any) -> _Response:
     """Process an activity received in the inbox"""
-    task = p.parse(flask.request)
-    app.logger.info(f"task={task!r}")
     iri = task.payload
     try:
         activity = ap.fetch_remote_activity(iri)
-        app.logger.info(f"activity={activity!r}")
+        app.logger.info("activity=%r", activity)
 
         flags: _NewMeta = {}
 
         set_inbox_flags(activity, flags)
-        app.logger.info(f"a={activity}, flags={flags!r}")
+        app.logger.info("a=%s, flags=%r", activity, flags)
         if flags:
             DB.activities.update_one({"remote_id": activity.id}, {"$set": flags})
 
-        app.logger.info(f"new activity {iri} processed")
+        app.logger.info("new activity %s processed", iri)
     except (ActivityGoneError, ActivityNotFoundError):
-        app.logger.exception(f"dropping activity {iri}, skip processing")
+        app.logger.exception("dropping activity %s, skip processing", iri)
         return ""
     except Exception as err:
-        app.logger.exception(f"failed to process new activity {iri}")
+        app.logger.exception("failed to process new activity %s", iri)
         raise TaskError() from err
 
     return ""
@@ -1,3 +1,4 @@
+import base64
 import binascii
 import hashlib
 import logging
@@ -12,6 +13,10 @@ from urllib.parse import urljoin
 from urllib.parse import urlparse
 
 from bson.objectid import ObjectId
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import padding
 from flask import url_for
 from little_boxes import activitypub as ap
 from little_boxes import strtobool
@@ -21,6 +26,9 @@ from little_boxes.activitypub import format_datetime
 from little_boxes.backend import Backend
 from little_boxes.errors import ActivityGoneError
 from little_boxes.httpsig import HTTPSigAuth
+from little_boxes.httpsig import _build_signed_string
+from little_boxes.key import Key
+from pymongo import UpdateMany
 
 from config import BASE_URL
 from config import DB
@@ -29,8 +37,8 @@ from config import ID
 from config import KEY
 from config import ME
 from config import USER_AGENT
+from core.db import bulk_write_activities
 from core.db import find_one_activity
-from core.db import update_many_activities
 from core.db import update_one_activity
 from core.meta import Box
 from core.meta import FollowStatus
@@ -49,7 +57,52 @@ logger = logging.getLogger(__name__)
 
 _NewMeta = Dict[str, Any]
 
-SIG_AUTH = HTTPSigAuth(KEY)
+
+class _HTTPSigAuth(HTTPSigAuth):
+    """`HTTPSigAuth` that loads the private key once and signs with OpenSSL (via `cryptography`)."""
+
+    _SIGNED_HEADERS = "(request-target) user-agent host date digest content-type"
+
+    def __init__(self, key: Key) -> None:
+        super().__init__(key)
+        self._privkey = serialization.load_pem_private_key(
+            key.privkey_pem.encode(), password=None, backend=default_backend()
+        )
+        self._key_id = key.key_id()
+
+    def __call__(self, r):
+        # Requests without body (i.e. authenticated fetch) are left to little_boxes
+        if not r.body:
+            return super().__call__(r)
+
+        body = r.body
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        bodydigest = "SHA-256=" + base64.b64encode(
+            hashlib.sha256(body).digest()
+        ).decode("utf-8")
+        date = datetime.utcnow().strftime("%a, %d %b %Y %H:%M:%S GMT")
+        r.headers.update(
+            {"Digest": bodydigest, "Date": date, "Host": urlparse(r.url).netloc}
+        )
+
+        to_be_signed = _build_signed_string(
+            self._SIGNED_HEADERS, r.method, r.path_url, r.headers, bodydigest
+        )
+        sig = base64.b64encode(
+            self._privkey.sign(
+                to_be_signed.encode("utf-8"), padding.PKCS1v15(), hashes.SHA256()
+            )
+        ).decode("utf-8")
+        r.headers["Signature"] = (
+            f'keyId="{self._key_id}",algorithm="rsa-sha256",'
+            f'headers="{self._SIGNED_HEADERS}",signature="{sig}"'
+        )
+
+        return r
+
+
+SIG_AUTH = _HTTPSigAuth(KEY)
 
 MY_PERSON = ap.Person(**ME)
 
@@ -689,29 +742,41 @@ def _cache_actor_icon(actor: ap.BaseActivity) -> None:
             logger.warning(f"failed to parse icon {actor.icon} for {actor!r}")
 
 
-def update_cached_actor(actor: ap.BaseActivity) -> None:
+def update_cached_actor(
+    actor: ap.BaseActivity, extra_ops: Optional[List[Any]] = None
+) -> None:
+    """Refresh the cached actor everywhere, `extra_ops` are sent along in the same `bulk_write`."""
     actor_hash = _actor_hash(actor)
-    update_many_activities(
-        {
-            **flag(MetaKey.ACTOR_ID, actor.id),
-            **flag(MetaKey.ACTOR_HASH, {"$ne": actor_hash}),
-        },
-        upsert(
-            {MetaKey.ACTOR: actor.to_dict(embed=True), MetaKey.ACTOR_HASH: actor_hash}
-        ),
+    ops = list(extra_ops or [])
+    ops.append(
+        UpdateMany(
+            {
+                **flag(MetaKey.ACTOR_ID, actor.id),
+                **flag(MetaKey.ACTOR_HASH, {"$ne": actor_hash}),
+            },
+            upsert(
+                {
+                    MetaKey.ACTOR: actor.to_dict(embed=True),
+                    MetaKey.ACTOR_HASH: actor_hash,
+                }
+            ),
+        )
     )
-    update_many_activities(
-        {
-            **flag(MetaKey.OBJECT_ACTOR_ID, actor.id),
-            **flag(MetaKey.OBJECT_ACTOR_HASH, {"$ne": actor_hash}),
-        },
-        upsert(
+    ops.append(
+        UpdateMany(
             {
-                MetaKey.OBJECT_ACTOR: actor.to_dict(embed=True),
-                MetaKey.OBJECT_ACTOR_HASH: actor_hash,
-            }
-        ),
+                **flag(MetaKey.OBJECT_ACTOR_ID, actor.id),
+                **flag(MetaKey.OBJECT_ACTOR_HASH, {"$ne": actor_hash}),
+            },
+            upsert(
+                {
+                    MetaKey.OBJECT_ACTOR: actor.to_dict(embed=True),
+                    MetaKey.OBJECT_ACTOR_HASH: actor_hash,
+                }
+            ),
+        )
     )
+    bulk_write_activities(ops)
     DB.replies.update_many(
         {
             **flag(MetaKey.ACTOR_ID, actor.id),
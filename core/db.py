@@ -1,21 +1,43 @@
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime
+from datetime import timedelta
 from enum import Enum
 from enum import unique
 from typing import Any
 from typing import Dict
 from typing import Iterable
+from typing import List
 from typing import Optional
+from typing import Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
 
 from config import DB
 
+logger = logging.getLogger(__name__)
+
 _Q = Dict[str, Any]
 _D = Dict[str, Any]
 _Doc = Optional[_D]
 
+# Queued updates are flushed every `_FLUSH_MAX_OPS` ops or every `_FLUSH_INTERVAL` seconds
+_FLUSH_MAX_OPS = 500
+_FLUSH_INTERVAL = 2.0
+
+_queued_updates: List[Tuple[_Q, _Q]] = []
+_queued_updates_lock = threading.Lock()
+_flusher: Optional[threading.Thread] = None
+
 
 @unique
 class CollectionName(Enum):
     ACTIVITIES = "activities"
     REMOTE = "remote"
+    INFLIGHT = "inflight"
 
 
 def find_one_activity(q: _Q) -> _Doc:
@@ -34,5 +56,91 @@ def update_many_activities(q: _Q, update: _Q) -> None:
     DB[CollectionName.ACTIVITIES.value].update_many(q, update)
 
 
+def bulk_write_activities(ops: List[Any]) -> None:
+    DB[CollectionName.ACTIVITIES.value].bulk_write(ops, ordered=False)
+
+
+def flush_queued_updates() -> None:
+    """Send all the queued activities updates with a single `bulk_write`."""
+    with _queued_updates_lock:
+        ops = _queued_updates[:]
+        del _queued_updates[:]
+
+    if not ops:
+        return
+
+    try:
+        DB[CollectionName.ACTIVITIES.value].bulk_write(
+            [UpdateOne(q, update, upsert=False) for q, update in ops], ordered=False
+        )
+    except Exception:
+        # Put them back in front of the ones queued in the meantime (so the order is kept), they will be
+        # retried on the next flush (re-applying the ones that succeeded is fine, they're all `$set`)
+        with _queued_updates_lock:
+            _queued_updates[:0] = ops
+        raise
+
+
+def _flush_at_exit() -> None:
+    try:
+        flush_queued_updates()
+    except Exception:
+        # Last chance, log the filters so the lost updates can be recovered
+        logger.exception(
+            "failed to flush the queued updates, dropping: %r",
+            [q for q, _ in _queued_updates],
+        )
+
+
+def _flush_loop() -> None:
+    while 1:
+        time.sleep(_FLUSH_INTERVAL)
+        try:
+            flush_queued_updates()
+        except Exception:
+            logger.exception("failed to flush the queued updates")
+
+
+def queue_update_activity(q: _Q, update: _Q) -> None:
+    """Like `update_one_activity`, but the update is batched with others and applied later."""
+    global _flusher
+    with _queued_updates_lock:
+        _queued_updates.append((q, update))
+        should_flush = len(_queued_updates) >= _FLUSH_MAX_OPS
+
+        # Started lazily, so it runs in the (forked) worker process
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, daemon=True)
+            _flusher.start()
+            atexit.register(_flush_at_exit)
+
+    if should_flush:
+        flush_queued_updates()
+
+
 def update_one_remote(filter_: _Q, update: _Q, upsert: bool = False) -> None:
     DB[CollectionName.REMOTE.value].update_one(filter_, update, upsert)
+
+
+def bulk_write_remote(ops: List[Any]) -> None:
+    DB[CollectionName.REMOTE.value].bulk_write(ops, ordered=False)
+
+
+def claim(key: str, ttl: int = 30) -> bool:
+    """Returns `False` if the key is already claimed and not expired (like a Redis `SET key 1 NX EX ttl`)."""
+    now = datetime.utcnow()
+    try:
+        # Will try to insert a duplicate `_id` if the existing claim is not expired yet
+        DB[CollectionName.INFLIGHT.value].update_one(
+            {"_id": key, "expire_at": {"$lt": now}},
+            {"$set": {"expire_at": now + timedelta(seconds=ttl)}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return False
+
+    return True
+
+
+def release(key: str) -> None:
+    DB[CollectionName.INFLIGHT.value].delete_one({"_id": key})
@@ -0,0 +1,134 @@
+"""Concurrent delivery of activities to remote inboxes."""
+import asyncio
+import logging
+from typing import Any
+from typing import Dict
+from typing import List
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+from core.activitypub import SIG_AUTH
+from core.remote import track_sends
+
+logger = logging.getLogger(__name__)
+
+# Max number of seconds to wait for a single remote inbox
+_DELIVERY_TIMEOUT = 30
+
+# Max number of seconds for a whole broadcast (must stay below the gunicorn timeout)
+_BROADCAST_TIMEOUT = 300
+
+# Used for single deliveries (i.e. retries), keep-alive connections are re-used across tasks
+_SESSION = requests.Session()
+_SESSION.mount(
+    "https://", HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=0)
+)
+_SESSION.mount(
+    "http://", HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=0)
+)
+
+
+def _signed_headers(payload: str, url: str) -> Dict[str, str]:
+    """Returns the headers (including the HTTP signature) for POSTing `payload` to `url`."""
+    req = requests.Request(
+        "POST",
+        url,
+        data=payload,
+        headers={
+            "Content-Type": config.HEADERS[1],
+            "Accept": config.HEADERS[1],
+            "User-Agent": config.USER_AGENT,
+        },
+    ).prepare()
+    SIG_AUTH(req)
+    headers = dict(req.headers)
+    # Let aiohttp compute it from the actual body
+    headers.pop("Content-Length", None)
+    return headers
+
+
+def post(payload: str, url: str) -> requests.Response:
+    """POST the payload to a single remote inbox."""
+    return _SESSION.post(
+        url,
+        data=payload,
+        auth=SIG_AUTH,
+        headers={
+            "Content-Type": config.HEADERS[1],
+            "Accept": config.HEADERS[1],
+            "User-Agent": config.USER_AGENT,
+        },
+    )
+
+
+async def _post(
+    session: aiohttp.ClientSession, url: str, payload: str, body: bytes
+) -> int:
+    # Signed here so an invalid inbox URL only fails the delivery to this inbox
+    # (the signature covers the `(request-target)`, so it's computed once per inbox)
+    headers = _signed_headers(payload, url)
+    async with session.post(url, data=body, headers=headers) as resp:
+        # Consume the body so the connection can be re-used
+        await resp.read()
+        logger.info("POST %s resp=%s", url, resp.status)
+        return resp.status
+
+
+async def _broadcast(payload: str, recipients: List[str]) -> Dict[str, Any]:
+    body = payload.encode("utf-8")
+
+    # Keep-alive connections are re-used, and each host gets at most a few of them
+    connector = aiohttp.TCPConnector(limit=64, limit_per_host=4, ttl_dns_cache=300)
+    async with aiohttp.ClientSession(
+        connector=connector,
+        # Time spent waiting for a connection in the pool is not counted
+        timeout=aiohttp.ClientTimeout(
+            total=None, sock_connect=_DELIVERY_TIMEOUT, sock_read=_DELIVERY_TIMEOUT
+        ),
+    ) as session:
+        # All the deliveries started at the same time, so this acts as a deadline for the broadcast
+        results = await asyncio.gather(
+            *[
+                asyncio.wait_for(
+                    _post(session, recp, payload, body), _BROADCAST_TIMEOUT
+                )
+                for recp in recipients
+            ],
+            return_exceptions=True,
+        )
+
+    return dict(zip(recipients, results))
+
+
+def broadcast(payload: str, recipients: List[str]) -> List[str]:
+    """POST the payload to all the recipients concurrently, returns the recipients that need a retry."""
+    recipients = list(set(recipients))
+    results = asyncio.run(_broadcast(payload, recipients))
+
+    successful = []
+    failed = []
+    to_retry = []
+    for recp, res in results.items():
+        if isinstance(res, Exception):
+            # Same as a `requests.RequestException` for a single delivery: no retry
+            logger.error("failed to POST to %s: %r", recp, res)
+            failed.append(recp)
+        elif 400 <= res <= 499:
+            logger.info("client error for %s, no retry", recp)
+            failed.append(recp)
+        elif res >= 500:
+            failed.append(recp)
+            to_retry.append(recp)
+        else:
+            successful.append(recp)
+
+    # Only stats, a failure must not make the (already delivered) broadcast fail
+    try:
+        track_sends(successful, failed)
+    except Exception:
+        logger.exception("failed to track the sends")
+
+    return to_retry
@@ -54,8 +54,26 @@ def threads_of_interest() -> List[str]:
     return list(out)
 
 
-def _keep(data: Dict[str, Any]) -> None:
-    DB.activities.update_one({"_id": data["_id"]}, {"$set": {"meta.gc_keep": True}})
+def _truthy(field: str) -> Dict[str, Any]:
+    return {field: {"$exists": True, "$nin": [None, False, "", 0]}}
+
+
+def _keep_flagged(collection: Any, q: Dict[str, Any], fields: List[str]) -> int:
+    """Flag (in a single query) the documents that must be kept according to their meta flags."""
+    return collection.update_many(
+        {**q, "$or": [_truthy(field) for field in fields]},
+        {"$set": {"meta.gc_keep": True}},
+    ).modified_count
+
+
+def _keep_all(collection: Any, ids: List[Any]) -> None:
+    if ids:
+        collection.update_many({"_id": {"$in": ids}}, {"$set": {"meta.gc_keep": True}})
+
+
+def _delete_all(collection: Any, ids: List[Any]) -> None:
+    if ids:
+        collection.delete_many({"_id": {"$in": ids}})
 
 
 def perform() -> None:  # noqa: C901
@@ -75,15 +93,21 @@ def perform() -> None:  # noqa: C901
 
     create_deleted = 0
     create_count = 0
+    create_q = {
+        "box": Box.INBOX.value,
+        "type": ap.ActivityType.CREATE.value,
+        _meta(MetaKey.PUBLISHED): {"$lt": d},
+        "meta.gc_keep": {"$exists": False},
+    }
+    # Bookmarked, boosted or liked activities are kept, no need to look at them
+    create_kept = _keep_flagged(
+        DB.activities, create_q, ["meta.bookmarked", "meta.boosted", "meta.liked"]
+    )
+    logger.info(f"{create_kept} Create kept")
+    to_keep: List[Any] = []
+    to_delete: List[Any] = []
     # Go over the old Create activities
-    for data in DB.activities.find(
-        {
-            "box": Box.INBOX.value,
-            "type": ap.ActivityType.CREATE.value,
-            _meta(MetaKey.PUBLISHED): {"$lt": d},
-            "meta.gc_keep": {"$exists": False},
-        }
-    ).limit(500):
+    for data in DB.activities.find(create_q).limit(500):
         try:
             logger.info(f"data={data!r}")
             create_count += 1
@@ -92,7 +116,7 @@ def perform() -> None:  # noqa: C901
 
             # This activity has been bookmarked, keep it
             if meta.get("bookmarked"):
-                _keep(data)
+                to_keep.append(data["_id"])
                 continue
 
             obj = None
@@ -108,26 +132,26 @@ def perform() -> None:  # noqa: C901
 
             # This activity mentions the server actor, keep it
             if obj and obj.has_mention(ID):
-                _keep(data)
+                to_keep.append(data["_id"])
                 continue
 
             # This activity is a direct reply of one the server actor activity, keep it
             if obj:
                 in_reply_to = obj.get_in_reply_to()
                 if in_reply_to and in_reply_to.startswith(ID):
-                    _keep(data)
+                    to_keep.append(data["_id"])
                     continue
 
             # This activity is part of a thread we want to keep, keep it
             if obj and in_reply_to and meta.get("thread_root_parent"):
                 thread_root_parent = meta["thread_root_parent"]
                 if thread_root_parent.startswith(ID) or thread_root_parent in toi:
-                    _keep(data)
+                    to_keep.append(data["_id"])
                     continue
 
             # This activity was boosted or liked, keep it
             if meta.get("boosted") or meta.get("liked"):
-                _keep(data)
+                to_keep.append(data["_id"])
                 continue
 
             # TODO(tsileo): remove after tests
@@ -135,7 +159,7 @@ def perform() -> None:  # noqa: C901
                 logger.warning(
                     f"{activity!r} would not have been deleted, skipping for now"
                 )
-                _keep(data)
+                to_keep.append(data["_id"])
                 continue
 
             # Delete the cached attachment
@@ -143,14 +167,24 @@ def perform() -> None:  # noqa: C901
                 MEDIA_CACHE.fs.delete(grid_item._id)
 
             # Delete the activity
-            DB.activities.delete_one({"_id": data["_id"]})
+            to_delete.append(data["_id"])
             create_deleted += 1
         except Exception:
             logger.exception(f"failed to process {data!r}")
 
-    for data in DB.replies.find(
-        {_meta(MetaKey.PUBLISHED): {"$lt": d}, "meta.gc_keep": {"$exists": False}}
-    ).limit(500):
+    _keep_all(DB.activities, to_keep)
+    _delete_all(DB.activities, to_delete)
+
+    replies_q = {
+        _meta(MetaKey.PUBLISHED): {"$lt": d},
+        "meta.gc_keep": {"$exists": False},
+    }
+    _keep_flagged(
+        DB.replies, replies_q, ["meta.bookmarked", "meta.boosted", "meta.liked"]
+    )
+    to_keep = []
+    to_delete = []
+    for data in DB.replies.find(replies_q).limit(500):
         try:
             logger.info(f"data={data!r}")
             create_count += 1
@@ -159,7 +193,7 @@ def perform() -> None:  # noqa: C901
 
             # This activity has been bookmarked, keep it
             if meta.get("bookmarked"):
-                _keep(data)
+                to_keep.append(data["_id"])
                 continue
 
             obj = ap.parse_activity(data["activity"])
@@ -170,12 +204,12 @@ def perform() -> None:  # noqa: C901
             if in_reply_to and meta.get("thread_root_parent"):
                 thread_root_parent = meta["thread_root_parent"]
                 if thread_root_parent.startswith(ID) or thread_root_parent in toi:
-                    _keep(data)
+                    to_keep.append(data["_id"])
                     continue
 
             # This activity was boosted or liked, keep it
             if meta.get("boosted") or meta.get("liked"):
-                _keep(data)
+                to_keep.append(data["_id"])
                 continue
 
             # Delete the cached attachment
@@ -183,11 +217,14 @@ def perform() -> None:  # noqa: C901
                 MEDIA_CACHE.fs.delete(grid_item._id)
 
             # Delete the activity
-            DB.replies.delete_one({"_id": data["_id"]})
+            to_delete.append(data["_id"])
             create_deleted += 1
         except Exception:
             logger.exception(f"failed to process {data!r}")
 
+    _keep_all(DB.replies, to_keep)
+    _delete_all(DB.replies, to_delete)
+
     after_gc_create = perf_counter()
     time_to_gc_create = after_gc_create - start
     logger.info(
@@ -196,15 +233,17 @@ def perform() -> None:  # noqa: C901
 
     announce_count = 0
     announce_deleted = 0
-    # Go over the old Create activities
-    for data in DB.activities.find(
-        {
-            "box": Box.INBOX.value,
-            "type": ap.ActivityType.ANNOUNCE.value,
-            _meta(MetaKey.PUBLISHED): {"$lt": d},
-            "meta.gc_keep": {"$exists": False},
-        }
-    ).limit(500):
+    announce_q = {
+        "box": Box.INBOX.value,
+        "type": ap.ActivityType.ANNOUNCE.value,
+        _meta(MetaKey.PUBLISHED): {"$lt": d},
+        "meta.gc_keep": {"$exists": False},
+    }
+    _keep_flagged(DB.activities, announce_q, ["meta.bookmarked"])
+    to_keep = []
+    to_delete = []
+    # Go over the old Announce activities
+    for data in DB.activities.find(announce_q).limit(500):
         try:
             announce_count += 1
             remote_id = data["remote_id"]
@@ -214,14 +253,14 @@ def perform() -> None:  # noqa: C901
 
             # This activity has been bookmarked, keep it
             if meta.get("bookmarked"):
-                _keep(data)
+                to_keep.append(data["_id"])
                 continue
 
             object_id = activity.get_object_id()
 
             # This announce is for a local activity (i.e. from the outbox), keep it
             if object_id.startswith(ID):
-                _keep(data)
+                to_keep.append(data["_id"])
                 continue
 
             for grid_item in MEDIA_CACHE.fs.find({"remote_id": remote_id}):
@@ -232,12 +271,15 @@ def perform() -> None:  # noqa: C901
                 MEDIA_CACHE.fs.delete(grid_item._id)
 
             # Delete the activity
-            DB.activities.delete_one({"_id": data["_id"]})
+            to_delete.append(data["_id"])
 
             announce_deleted += 1
         except Exception:
             logger.exception(f"failed to process {data!r}")
 
+    _keep_all(DB.activities, to_keep)
+    _delete_all(DB.activities, to_delete)
+
     after_gc_announce = perf_counter()
     time_to_gc_announce = after_gc_announce - after_gc_create
     logger.info(
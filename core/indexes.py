@@ -24,7 +24,21 @@ def create_indexes():
         [(_meta(MetaKey.NOTIFICATION_UNREAD), pymongo.ASCENDING)]
     )
     DB.activities.create_index([("remote_id", pymongo.ASCENDING)])
-    DB.activities.create_index([("meta.actor_id", pymongo.ASCENDING)])
+
+    # Indexes for the cached actor updates (`update_cached_actor`), also used for the `meta.actor_id`
+    # only queries (it's a prefix of the compound index)
+    DB.activities.create_index(
+        [("meta.actor_id", pymongo.ASCENDING), ("meta.actor_hash", pymongo.ASCENDING)],
+        background=True,
+    )
+    DB.activities.create_index(
+        [
+            ("meta.object_actor_id", pymongo.ASCENDING),
+            ("meta.object_actor_hash", pymongo.ASCENDING),
+        ],
+        background=True,
+    )
+
     DB.activities.create_index([("meta.object_id", pymongo.ASCENDING)])
     DB.activities.create_index([("meta.mentions", pymongo.ASCENDING)])
     DB.activities.create_index([("meta.hashtags", pymongo.ASCENDING)])
@@ -83,12 +97,19 @@ def create_indexes():
         ]
     )
 
+    # Expired claims are removed automatically
+    DB.inflight.create_index([("expire_at", pymongo.ASCENDING)], expireAfterSeconds=0)
+
     # For the is_actor_icon_cached query
     MEDIA_CACHE.fs._GridFS__files.create_index([("url", 1), ("kind", 1)])
 
     # Replies index
     DB.replies.create_index([("remote_id", pymongo.ASCENDING)])
     DB.replies.create_index([("meta.thread_root_parent", pymongo.ASCENDING)])
+    DB.replies.create_index(
+        [("meta.actor_id", pymongo.ASCENDING), ("meta.actor_hash", pymongo.ASCENDING)],
+        background=True,
+    )
     DB.replies.create_index(
         [
             ("meta.thread_root_parent", pymongo.ASCENDING),
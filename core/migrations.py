@@ -376,3 +376,10 @@ class _20191106_PlaceTagToLocation(Migration):
                     "$set": {"activity.object.location": tag},
                 },
             )
+
+
+class _20261015_DropActorIdIndex(Migration):
+    def migrate(self) -> None:
+        # Made redundant by the compound `(meta.actor_id, meta.actor_hash)` index
+        if "meta.actor_id_1" in DB.activities.index_information():
+            DB.activities.drop_index("meta.actor_id_1")
@@ -1,6 +1,12 @@
+from collections import Counter
+from typing import Dict
+from typing import List
 from urllib.parse import urlparse
 
+from pymongo import UpdateOne
+
 from core.db import _Q
+from core.db import bulk_write_remote
 from core.db import update_one_remote
 from utils import now
 
@@ -36,3 +42,29 @@ def track_failed_send(url: str) -> None:
     now_ = now()
     _update(url, {"$inc": {"failed_send": 1}, "$set": {"last_contact": now_}})
     return None
+
+
+def track_sends(successful: List[str], failed: List[str]) -> None:
+    """Same as `track_successful_send`/`track_failed_send`, with a single `bulk_write` for all the servers."""
+    now_ = now()
+    counts: Counter = Counter()
+    for url in successful:
+        counts[(server(url), "successful_send")] += 1
+    for url in failed:
+        counts[(server(url), "failed_send")] += 1
+
+    updates: Dict[str, _Q] = {}
+    for (host, kind), count in counts.items():
+        update = updates.setdefault(host, {"$inc": {}, "$set": {"last_contact": now_}})
+        update["$inc"][kind] = count
+        if kind == "successful_send":
+            update["$set"]["last_successful_contact"] = now_
+            update["$set"]["last_successful_send"] = now_
+
+    if updates:
+        bulk_write_remote(
+            [
+                UpdateOne({"server": host}, update, upsert=True)
+                for host, update in updates.items()
+            ]
+        )
@@ -3,6 +3,7 @@ from datetime import datetime
 from datetime import timezone
 from typing import Any
 from typing import Dict
+from typing import List
 from typing import Set
 
 from little_boxes import activitypub as ap
@@ -72,6 +73,13 @@ class Tasks:
     def post_to_remote_inbox(payload: str, recp: str) -> None:
         p.push({"payload": payload, "to": recp}, "/task/post_to_remote_inbox")
 
+    @staticmethod
+    def broadcast(payload: str, recipients: List[str]) -> None:
+        if not recipients:
+            return None
+
+        p.push({"payload": payload, "recipients": recipients}, "/task/broadcast")
+
     @staticmethod
     def forward_activity(iri: str) -> None:
         p.push(iri, "/task/forward_activity")
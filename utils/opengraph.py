@@ -1,12 +1,16 @@
+import asyncio
 import logging
 import mimetypes
 from typing import Any
 from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
 from typing import Set
 from urllib.parse import urlparse
 
+import aiohttp
 import opengraph
-import requests
 from bs4 import BeautifulSoup
 from little_boxes import activitypub as ap
 from little_boxes.errors import NotAnActivityError
@@ -39,91 +43,121 @@ def links_from_note(note: Dict[str, Any]) -> Set[str]:
     return links
 
 
-def fetch_og_metadata(user_agent, links):
-    res = []
-    for l in links:
-        # Try to skip media early
-        mimetype, _ = mimetypes.guess_type(l)
-        if mimetype and mimetype.split("/")[0] in ["image", "video", "audio"]:
-            logger.info(f"skipping media link {l}")
-            continue
-
-        check_url(l)
-
-        # Remove any AP objects
-        try:
-            lookup(l)
-            continue
-        except NotAnActivityError:
-            pass
-        except Exception:
-            logger.exception(f"skipping {l} because of issues during AP lookup")
-            continue
-
-        try:
-            h = requests.head(
-                l, headers={"User-Agent": user_agent}, timeout=3, allow_redirects=True
-            )
+def _is_html_page(url: str) -> bool:
+    """Returns `False` for links that are media or ActivityPub objects (may block on the AP lookup)."""
+    # Try to skip media early
+    mimetype, _ = mimetypes.guess_type(url)
+    if mimetype and mimetype.split("/")[0] in ["image", "video", "audio"]:
+        logger.info(f"skipping media link {url}")
+        return False
+
+    check_url(url)
+
+    # Remove any AP objects
+    try:
+        lookup(url)
+        return False
+    except NotAnActivityError:
+        pass
+    except Exception:
+        logger.exception(f"skipping {url} because of issues during AP lookup")
+        return False
+
+    return True
+
+
+def _parse_og_metadata(url: str, html: str) -> Optional[Dict[str, Any]]:
+    try:
+        data = dict(opengraph.OpenGraph(html=html))
+    except Exception:
+        logger.exception(f"failed to parse {url}")
+        return None
+
+    # Keep track of the fetched URL as some crappy websites use relative URLs everywhere
+    data["_input_url"] = url
+    u = urlparse(url)
+
+    # If it's a relative URL, build the absolute version
+    if "image" in data and data["image"].startswith("/"):
+        data["image"] = u._replace(
+            path=data["image"], params="", query="", fragment=""
+        ).geturl()
+
+    if "url" in data and data["url"].startswith("/"):
+        data["url"] = u._replace(
+            path=data["url"], params="", query="", fragment=""
+        ).geturl()
+
+    if not data.get("url"):
+        return None
+
+    return data
+
+
+async def _fetch_og_metadata(
+    session: aiohttp.ClientSession, user_agent: str, url: str
+) -> Optional[Dict[str, Any]]:
+    loop = asyncio.get_running_loop()
+    if not await loop.run_in_executor(None, _is_html_page, url):
+        return None
+
+    headers = {"User-Agent": user_agent}
+    try:
+        async with session.head(
+            url,
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=3),
+            allow_redirects=True,
+        ) as h:
             h.raise_for_status()
-        except requests.HTTPError as http_err:
-            logger.debug(
-                f"failed to HEAD {l}, got a {http_err.response.status_code}: {http_err.response.text}"
-            )
-            continue
-        except requests.RequestException as err:
-            logger.debug(f"failed to HEAD {l}: {err!r}")
-            continue
-
-        if h.headers.get("content-type") and not h.headers.get(
-            "content-type"
-        ).startswith("text/html"):
-            logger.debug(f"skipping {l} for bad content type")
-            continue
-
-        try:
-            r = requests.get(
-                l, headers={"User-Agent": user_agent}, timeout=5, allow_redirects=True
-            )
+            content_type = h.headers.get("content-type")
+    except aiohttp.ClientResponseError as http_err:
+        logger.debug(f"failed to HEAD {url}, got a {http_err.status}")
+        return None
+    except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+        logger.debug(f"failed to HEAD {url}: {err!r}")
+        return None
+
+    if content_type and not content_type.startswith("text/html"):
+        logger.debug(f"skipping {url} for bad content type")
+        return None
+
+    try:
+        async with session.get(
+            url,
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=5),
+            allow_redirects=True,
+        ) as r:
             r.raise_for_status()
-        except requests.HTTPError as http_err:
-            logger.debug(
-                f"failed to GET {l}, got a {http_err.response.status_code}: {http_err.response.text}"
-            )
-            continue
-        except requests.RequestException as err:
-            logger.debug(f"failed to GET {l}: {err!r}")
-            continue
-
-        # FIXME(tsileo): check mimetype via the URL too (like we do for images)
-        if not r.headers.get("content-type") or not r.headers.get(
-            "content-type"
-        ).startswith("text/html"):
-            continue
-
-        r.encoding = "UTF-8"
-        html = r.text
-        try:
-            data = dict(opengraph.OpenGraph(html=html))
-        except Exception:
-            logger.exception(f"failed to parse {l}")
-            continue
-
-        # Keep track of the fetched URL as some crappy websites use relative URLs everywhere
-        data["_input_url"] = l
-        u = urlparse(l)
-
-        # If it's a relative URL, build the absolute version
-        if "image" in data and data["image"].startswith("/"):
-            data["image"] = u._replace(
-                path=data["image"], params="", query="", fragment=""
-            ).geturl()
-
-        if "url" in data and data["url"].startswith("/"):
-            data["url"] = u._replace(
-                path=data["url"], params="", query="", fragment=""
-            ).geturl()
-
-        if data.get("url"):
-            res.append(data)
-
-    return res
+
+            # FIXME(tsileo): check mimetype via the URL too (like we do for images)
+            content_type = r.headers.get("content-type")
+            if not content_type or not content_type.startswith("text/html"):
+                return None
+
+            html = await r.text(encoding="UTF-8", errors="replace")
+    except aiohttp.ClientResponseError as http_err:
+        logger.debug(f"failed to GET {url}, got a {http_err.status}")
+        return None
+    except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+        logger.debug(f"failed to GET {url}: {err!r}")
+        return None
+
+    return _parse_og_metadata(url, html)
+
+
+async def fetch_og_metadata_async(
+    user_agent: str, links: Iterable[str]
+) -> List[Dict[str, Any]]:
+    """Fetch the OpenGraph metadata of all the links concurrently."""
+    async with aiohttp.ClientSession() as session:
+        res = await asyncio.gather(
+            *[_fetch_og_metadata(session, user_agent, link) for link in links]
+        )
+
+    return [data for data in res if data]
+
+
+def fetch_og_metadata(user_agent: str, links: Iterable[str]) -> List[Dict[str, Any]]:
+    return asyncio.run(fetch_og_metadata_async(user_agent, links))